@@ -35,11 +35,10 @@ import os
 import sys 
 import math
 import errno
-import fileinput
-import datetime
-import glob
-import shutil
-import platform
+import re
+import itertools
+import json
+import numpy as np
 
 try:
     from launcher import ParallelLauncher, startSofa
@@ -48,15 +47,277 @@ except:
                      +"Enter this command in your terminal (for temporary use) or in your .bashrc to resolve this:\n"\
                      +"export PYTHONPATH=/PathToYourSofaSrcFolder/tools/sofa-launcher")
 
-path = os.path.dirname(os.path.abspath(__file__))+'/template/'
-pathToReducedModel = '/'.join(os.path.dirname(os.path.abspath(__file__)).split('/')[:-1])+'/../morlib/'
+path = os.path.join(os.path.dirname(os.path.abspath(__file__)),'template')+os.sep
+pathToReducedModel = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),os.pardir,'morlib')+os.sep
 # print('pathToReducedModel : '+pathToReducedModel)
 
-slash = '/'
-if "Windows" in platform.platform():
-    slash ='\\'
+# "__all__" declaration of the morlib __init__.py, updated by PackageBuilder.addToLib
+_allPattern = re.compile(r'^(__all__\s*=\s*\[)(.*)\][ \t]*$', re.M)
+
+# Size of the chunks used when streaming a file into another one
+_copyBufferSize = 1 << 20
+
+# Default parameters of the MOR components for the preparation (phase 3) & the final scene (phase 4)
+# the values starting with '$' are filled in by ReductionParam.addParamWrapper
+_paramPrepareTemplate = {
+        'paramForcefield' : {
+            'prepareECSW' : True,
+            'modesPath': '$modesPath',
+            'periodSaveGIE' : '$periodSaveGIE',
+            'nbTrainingSet' : '$nbTrainingSet'},
+
+        'paramMORMapping' : {
+            'input': '@../MechanicalObject',
+            'modesPath': '$modesPath'},
+
+        'paramMappedMatrixMapping' : {
+            'nodeToParse': '$nodeToParse',
+            'template': 'Vec1d,Vec1d',
+            'object1': '@./MechanicalObject',
+            'object2': '@./MechanicalObject',
+            'timeInvariantMapping1': True,
+            'timeInvariantMapping2': True,
+            'performECSW': False}
+        }
+
+_paramPerformTemplate = {
+        'paramForcefield' : {
+            'performECSW': True,
+            'modesPath': '$modesPath',
+            'RIDPath': '$dataFolder',
+            'weightsPath': '$dataFolder'},
+
+        'paramMORMapping' : {
+            'input': '@../MechanicalObject',
+            'modesPath': '$modesPath'},
+
+        'paramMappedMatrixMapping' : {
+            'nodeToParse': '$nodeToParse',
+            'template': 'Vec1d,Vec1d',
+            'object1': '@./MechanicalObject',
+            'object2': '@./MechanicalObject',
+            'timeInvariantMapping1': True,
+            'timeInvariantMapping2': True,
+            'listActiveNodesPath' : '$listActiveNodesPath',
+            'performECSW': True,
+            'usePrecomputedMass': True,
+            'precomputedMassPath': '$precomputedMassPath'}
+        }
+
+# Compiled phase table kernel, built on first use by _getPhaseTable
+# (False if Numba isn't available)
+_phaseTable = None
+
+def _getPhaseTable():
+    '''
+    Return the Numba compiled equivalent of the NumPy phase table of ReductionAnimations.generateListOfPhase,
+    or False if Numba isn't installed.
+
+    Numba is optional & slow to import, it is only imported here so that the Sofa scenes
+    importing this module don't pay for it.
+    '''
+    global _phaseTable
+
+    if _phaseTable is None:
+        try:
+            from numba import njit
+        except ImportError:
+            _phaseTable = False
+            return _phaseTable
+
+        @njit(cache=True)
+        def phaseTable(nbActuator):
+            '''
+            Return the table and the number of active actuators of each row
+            '''
+            nbPossibility = 2**nbActuator
+            phaseNum = np.empty((nbPossibility,nbActuator), np.int8)
+            nbActive = np.empty(nbPossibility, np.uint8)
+            # plain range() loops & the row hoisted out of the inner loop
+            # let Numba vectorize it (enumerate would prevent it)
+            for i in range(nbPossibility):
+                row = phaseNum[i]
+                nb = 0
+                for j in range(nbActuator):
+                    bit = (i >> (nbActuator-1-j)) & 1
+                    row[j] = bit
+                    nb += bit
+                nbActive[i] = nb
+            return phaseNum, nbActive
+
+        _phaseTable = phaseTable
+
+    return _phaseTable
+
+def _readTemplate(fileName):
+    '''
+    '''
+    with open(path+fileName, "r") as templateFile:
+        return templateFile.read()
+
+# Content of the scene templates, read once at import by file name
+_templates = {fileName: _readTemplate(fileName) for fileName in ("phase1_snapshots.py",
+                                                                 "phase2_prepareECSW.py",
+                                                                 "phase3_performECSW.py",
+                                                                 "debug_scene.py")}
+
+def _matchElementsFiles(gieFilesNames,savedElementsFilesNames):
+    '''
+    Return *savedElementsFilesNames* ordered like *gieFilesNames*
+
+    The GIE file of a forcefield is "<forcefieldName>_Gie.txt" & its
+    elements are saved in "<forcefieldName>_<valueType>_elmts.txt"
+    '''
+    elmtsByForcefield = {fileName[:-len('_elmts.txt')].rsplit('_',1)[0]: fileName
+                            for fileName in savedElementsFilesNames}
+    try:
+        return [elmtsByForcefield[fileName[:-len('_Gie.txt')]] for fileName in gieFilesNames]
+    except KeyError as exc:
+        raise IOError("There is no saved elements file for the forcefield "+str(exc)\
+            +"\nPlease re-generate them with phase 3")
+
+def _computeRIDandActiveNodes(args):
+    '''
+    Worker of :py:func:`ReduceModel.phase4`, compute the RID & weights of one GIE file
+    then return the list of active nodes of its forcefield
+    '''
+    # MOR IMPORT
+    from script import readGieFileAndComputeRIDandWeights, convertRIDinActiveNodes
+
+    gieFileName, RIDFileName, weightsFileName, elmtsFileName, listActiveNodesFileName, tolGIE, verbose, cacheDir = args
+
+    def compute():
+        readGieFileAndComputeRIDandWeights( gieFileName, RIDFileName, weightsFileName, tolGIE, verbose= verbose)
+        return convertRIDinActiveNodes( RIDFileName, elmtsFileName, listActiveNodesFileName, verbose= verbose)
+
+    return _cachedCall( cacheDir,
+                        [gieFileName, elmtsFileName],
+                        [RIDFileName, weightsFileName, listActiveNodesFileName],
+                        (tolGIE,),
+                        compute)
+
+def _hashFiles(key, fileNames):
+    '''
+    Update the hash object *key* with the content of each file of *fileNames*
+    '''
+    import hashlib
+
+    for fileName in fileNames:
+        fileKey = hashlib.sha1()
+        with open(fileName, 'rb') as f:
+            for chunk in iter(lambda: f.read(_copyBufferSize), b''):
+                fileKey.update(chunk)
+        key.update(fileKey.digest())
+
+def _cachedCall(cacheDir, inputFiles, outputFiles, params, fct, *args, **kwargs):
+    '''
+    Call ``fct(*args, **kwargs)`` unless a previous call with the same params was made
+    on inputFiles with the same content.
+
+    In that case the outputFiles written by this previous call are restored from cacheDir
+    and its returned value is given back. If cacheDir is None the cache is bypassed.
+
+    The phases rewrite the files read by the next one even when their data is unchanged,
+    so their modification times can't be used to detect a change.
+    '''
+    if cacheDir is None:
+        return fct(*args, **kwargs)
+
+    import hashlib
+    import pickle
+    import shutil
+
+    key = hashlib.sha1(repr((fct.__name__, params)).encode('utf-8'))
+    _hashFiles(key, inputFiles)
+    entryDir = os.path.join(cacheDir, key.hexdigest())
+    resultFile = os.path.join(entryDir, 'result.pkl')
 
-class ObjToAnimate():
+    if os.path.isfile(resultFile):
+        for i, fileName in enumerate(outputFiles):
+            shutil.copyfile(os.path.join(entryDir, str(i)), fileName)
+        with open(resultFile, 'rb') as f:
+            return pickle.load(f)
+
+    result = fct(*args, **kwargs)
+
+    if all(os.path.isfile(fileName) for fileName in outputFiles):
+        try:
+            os.makedirs(entryDir)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+        for i, fileName in enumerate(outputFiles):
+            shutil.copyfile(fileName, os.path.join(entryDir, str(i)))
+        # written last, an entry is only valid once all its outputs are stored
+        with open(resultFile, 'wb') as f:
+            pickle.dump(result, f, 2)
+
+    return result
+
+def _canFork():
+    '''
+    Return True if multiprocessing starts its workers by forking.
+
+    Otherwise (Windows, macOS with Python 3.8+) each worker re-imports the main script,
+    which would re-run a reduction script not guarded by ``if __name__ == '__main__'``.
+    '''
+    import multiprocessing
+
+    try:
+        return multiprocessing.get_start_method() == 'fork'
+    except AttributeError:
+        # Python 2 always forks on POSIX systems
+        return os.name == 'posix'
+
+def _appendFile(src,dst):
+    '''
+    Append the opened file *src* to the opened file *dst*, when the platform allows it
+    the data is copied by the kernel (sendfile) without going through Python buffers
+    '''
+    if hasattr(os, 'sendfile'):
+        dst.flush()
+        size = os.fstat(src.fileno()).st_size
+        offset = 0
+        try:
+            while offset < size:
+                sent = os.sendfile(dst.fileno(), src.fileno(), offset, size-offset)
+                if sent == 0:
+                    break
+                offset += sent
+        except OSError as exc:
+            # Nothing has been written yet, the files don't support sendfile
+            if offset or exc.errno not in (errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK, errno.EOPNOTSUPP):
+                raise
+        else:
+            dst.seek(0, os.SEEK_END)
+            return
+
+    import shutil
+    shutil.copyfileobj(src, dst, _copyBufferSize)
+
+def _listResultFiles(dirPath):
+    '''
+    Sort in one directory listing the files of *dirPath* produced by the reduction,
+    return the names of its elements, GIE & reduced mass files
+    '''
+    elmtsFiles, gieFiles, massFiles = [], [], []
+    for fileName in os.listdir(dirPath):
+        if fileName.endswith('_elmts.txt'):
+            elmtsFiles.append(fileName)
+        elif fileName.endswith('_Gie.txt'):
+            gieFiles.append(fileName)
+        elif fileName.endswith('_reduced.txt'):
+            massFiles.append(fileName)
+    return elmtsFiles, gieFiles, massFiles
+
+def _fillParamTemplate(template,values):
+    '''
+    Return a new dict of dict from *template* where each '$' value is replaced by its entry in *values*
+    '''
+    return {paramName: {key: values.get(value, value) for key, value in param.items()}
+            for paramName, param in template.items()}
+
+class ObjToAnimate(object):
     '''
     **Class allowing us to store in 1 object all the information about a specific animation**
 
@@ -104,12 +365,12 @@ class ObjToAnimate():
 
     '''
 
+    # Plain record, possibly built by the thousand for big sweeps: no per-instance __dict__
+    __slots__ = ('location','animFct','item','duration','params')
+
     def __init__(self,location, animFct='defaultShaking', item=None, duration=-1, **params):
         self.location = location # #: location var
-        if isinstance(animFct, str):
-            self.animFct = 'animation.shakingAnimations.'+animFct
-        else:
-            self.animFct = animFct
+        self.animFct = 'animation.shakingAnimations.'+animFct if isinstance(animFct, str) else animFct
         self.item = item
         self.duration = duration
         self.params = params 
@@ -136,6 +397,7 @@ class ReductionAnimations():
         self.nbIterations = 0
         self.setNbIteration()
 
+        # int8 array (nbPossibility x nbActuator) of 0/1 giving which actuators are animated in each phase
         self.phaseNumClass = None
         self.generateListOfPhase(self.nbPossibility,self.nbActuator)
 
@@ -146,30 +408,33 @@ class ReductionAnimations():
         if nbIterations :
             self.nbIterations = int(math.ceil(nbIterations))
         else :
-            for obj in self.listObjToAnimate:
-                tmp = 0
-                if all (k in obj.params for k in ("incr","incrPeriod")):
-                    tmp = ((obj.params['rangeOfAction']/obj.params['incr'])-1)*obj.params['incrPeriod'] + 2*obj.params['incrPeriod']-1
-                if tmp > self.nbIterations:
-                    self.nbIterations = int(math.ceil(tmp))
+            params = [obj.params for obj in self.listObjToAnimate
+                      if all (k in obj.params for k in ("incr","incrPeriod"))]
+            if params:
+                rangeOfAction = np.array([param['rangeOfAction'] for param in params])
+                incr = np.array([param['incr'] for param in params])
+                incrPeriod = np.array([param['incrPeriod'] for param in params])
+                tmp = np.ceil(((rangeOfAction/incr)-1)*incrPeriod + 2*incrPeriod-1).max()
+                self.nbIterations = max(self.nbIterations,int(tmp))
 
     def generateListOfPhase(self,nbPossibility,nbActuator):
         '''
         '''
 
-        phaseNum = [[0] * nbActuator for i in range(nbPossibility)]
-        phaseNumClass = []
-        for i in range(nbPossibility):
-            binVal = "{0:b}".format(i)
-            for j in range(len(binVal)):
-                phaseNum[i][j + nbActuator-len(binVal)] = int(binVal[j])
-
-        for nb in range(nbActuator+1):
-            for i in range(nbPossibility):
-                if sum(phaseNum[i]) == nb:
-                    phaseNumClass.append(phaseNum[i])
+        # Each row is the binary decomposition of its index (most significant bit first),
+        # rows are then stably sorted by number of active actuators
+        phaseTable = _getPhaseTable() if nbActuator >= 16 else None
+        if phaseTable:
+            phaseNum, nbActive = phaseTable(nbActuator)
+        else:
+            index = np.arange(nbPossibility, dtype=np.int64)[:, np.newaxis]
+            phaseNum = ((index >> np.arange(nbActuator-1, -1, -1)) & 1).astype(np.int8)
+            nbActive = phaseNum.sum(axis=1, dtype=np.uint8)
+        # A small uint8 key keeps the stable sort cheap, NumPy >= 1.17 even
+        # runs it as a radix sort (older releases use a real mergesort)
+        order = np.argsort(nbActive, kind='mergesort')
 
-        self.phaseNumClass = phaseNumClass
+        self.phaseNumClass = phaseNum[order]
 
 class PackageBuilder():
     """
@@ -177,9 +442,14 @@ class PackageBuilder():
     """
     def __init__(self,outputDir,packageName = None ,addToLib = False):
 
-        self.outputDir = outputDir
+        self.outputDir = os.path.abspath(outputDir)
         self.meshes = []
 
+        # Directories already created/checked by checkExistance
+        self._madeDirs = set()
+        # Number of modes already read by checkNodeNbr, by (file, modification time, size)
+        self._nodeNbrCache = {}
+
         self.addToLibBool = addToLib
 
         if packageName :
@@ -188,32 +458,40 @@ class PackageBuilder():
             if os.path.isdir(pathToReducedModel+self.packageName) and addToLib:
                 raise Exception('A Package named %s already exist in the MOR lib !\nPlease choose another name for this new package' % packageName)
 
-        self.dataDir = self.outputDir+slash+'data'+slash
-        self.debugDir = self.outputDir+slash+'debug'+slash
-        self.meshDir = self.outputDir+slash+'mesh'+slash
+        self.dataDir = os.path.join(self.outputDir,'data')+os.sep
+        self.debugDir = os.path.join(self.outputDir,'debug')+os.sep
+        self.meshDir = os.path.join(self.outputDir,'mesh')+os.sep
+        self.cacheDir = os.path.join(self.outputDir,'.cache')+os.sep
 
-    def copy(self, src, dest):
+    def copy(self, src, dest, ignore=None):
         '''
         '''
+        import shutil
+
         try:
-            shutil.copytree(src, dest)
+            shutil.copytree(src, dest, ignore=ignore)
         except:
             # If the error was caused because the source wasn't a directory
             try:
                 shutil.copy(src, dest)
-            except:
+            except Exception as e:
                 print('Directory not copied. Error: %s' % e)
 
     def checkExistance(self,dir):
         '''
         '''
 
-        if not os.path.exists(os.path.dirname(dir)):
-            try:
-                os.makedirs(os.path.dirname(dir))
-            except OSError as exc: # Guard against race condition
-                if exc.errno != errno.EEXIST:
-                    raise
+        dirName = os.path.dirname(dir)
+        if dirName in self._madeDirs:
+            return
+
+        try:
+            os.makedirs(dirName)
+        except OSError as exc: # Guard against race condition
+            if exc.errno != errno.EEXIST:
+                raise
+
+        self._madeDirs.add(dirName)
 
     def checkNodeNbr(self,modeFileName):
         '''
@@ -221,12 +499,19 @@ class PackageBuilder():
 
         nbrOfModes = -1 
         try:
+            stat = os.stat(self.dataDir+modeFileName)
+            key = (self.dataDir+modeFileName, stat.st_mtime, stat.st_size)
+            if key in self._nodeNbrCache:
+                return self._nodeNbrCache[key]
 
-            with open(self.dataDir+modeFileName, "r") as myFile:
-                lineSplit = myFile.readline().strip().split();
-                nbrOfModes = lineSplit[1]
+            # The header "nbDOFs nbModes" is the first line, no need to read further
+            with open(self.dataDir+modeFileName, "rb") as myFile:
+                header = myFile.read(128).split(b'\n',1)[0]
+                nbrOfModes = header.split()[1]
 
-        except IOError:
+            self._nodeNbrCache[key] = int(nbrOfModes)
+
+        except (IOError, OSError):
             print("IOError : there is no "+self.dataDir+modeFileName)
 
         except:
@@ -238,23 +523,30 @@ class PackageBuilder():
         '''
         '''
 
-        counter = 1
-        for line in fileinput.input(self.debugDir+stateFileName, inplace=True):
-            if line.find('T=') != -1:
-                line = 'T= '+str(periodSaveGIE*counter)+'\n'
-                print("%s" % line),
-                counter += 1
-            else : print(line),
+        # Streamed line by line from a backup, the file is never loaded in memory
+        backupName = self.debugDir+stateFileName+'.bak'
+        os.rename(self.debugDir+stateFileName, backupName)
+
+        with open(self.debugDir+stateFileName, "wb") as stateFile:
+            self.copyStateFileIntoAnother(backupName,stateFile,periodSaveGIE,itertools.count(1))
+
+        os.remove(backupName)
 
     def copyFileIntoAnother(self,fileToCopy,fileToPasteInto):
         '''
         '''
 
         try:
-            with open(fileToPasteInto, "a") as myFile:
-                currentFile = open(fileToCopy, "r")
-                myFile.write(currentFile.read())
-                currentFile.close()
+            with open(fileToCopy, "rb") as currentFile:
+                # fileToPasteInto can either be a path or an already opened file
+                if hasattr(fileToPasteInto, 'write'):
+                    _appendFile(currentFile, fileToPasteInto)
+                else:
+                    # Not opened with O_APPEND ("ab") which sendfile doesn't support
+                    fd = os.open(fileToPasteInto, os.O_WRONLY | os.O_CREAT, 0o644)
+                    with os.fdopen(fd, "wb") as myFile:
+                        myFile.seek(0, os.SEEK_END)
+                        _appendFile(currentFile, myFile)
 
         except IOError:
             print("IOError : there is no "+fileToCopy+" , check the template log to find why.\nHere some clue for its probable origin :"\
@@ -263,44 +555,81 @@ class PackageBuilder():
         except:
             raise
 
-    def copyAndCleanState(self,results,periodSaveGIE,stateFileName,gie=None):
+    def copyStateFileIntoAnother(self,stateFileToCopy,stateFile,periodSaveGIE,counter):
         '''
+        Append *stateFileToCopy* to the opened *stateFile* while renumbering its time lines
+        (same result as :py:func:`copyFileIntoAnother` followed by :py:func:`cleanStateFile`
+        but in one pass), *counter* is shared between the successive calls.
         '''
 
-        self.checkExistance(self.debugDir)
+        try:
+            with open(stateFileToCopy, "rb") as currentFile:
+                for line in currentFile:
+                    if b'T=' in line:
+                        line = ('T= '+str(periodSaveGIE*next(counter))+'\n').encode()
+                    stateFile.write(line)
+
+        except IOError:
+            print("IOError : there is no "+stateFileToCopy+" , check the template log to find why.\nHere some clue for its probable origin :"\
+                            +"    - Your animation arguments are incorrect and it hasn't find anything to animate")
 
-        if os.path.exists(self.debugDir+stateFileName):
-            os.remove(self.debugDir+stateFileName)
-        if gie:
-            for fileName in gie :
-                if os.path.exists(self.debugDir+fileName):
-                    os.remove(self.debugDir+fileName)
+        except:
+            raise
+
+    def copyAndCleanState(self,results,periodSaveGIE,stateFileName,gie=None):
+        '''
+        '''
+        self.checkExistance(self.debugDir)
 
+        def mergeStateFiles():
+            counter = itertools.count(1)
+            with open(self.debugDir+stateFileName, "wb") as stateFile:
+                for res in results:
+                    self.copyStateFileIntoAnother(os.path.join(res["directory"],"stateFile.state"),stateFile,periodSaveGIE,counter)
 
-        for res in results:
-            self.copyFileIntoAnother(res["directory"]+slash+"stateFile.state",self.debugDir+stateFileName)
+        def mergeGieFiles(fileName):
+            # Each GIE file is opened (and emptied) once for all the results
+            with open(self.debugDir+fileName, "wb") as gieFile:
+                for res in results:
+                    self.copyFileIntoAnother(os.path.join(res["directory"],fileName),gieFile)
 
-            if gie:
-                for fileName in gie :
-                    self.copyFileIntoAnother(res["directory"]+slash+fileName,self.debugDir+fileName)
+        if not gie:
+            mergeStateFiles()
+            return
 
+        # Every destination file is independent, their merges are I/O bound so they can overlap in threads
+        from multiprocessing.pool import ThreadPool
 
-        self.cleanStateFile(periodSaveGIE,stateFileName)
+        pool = ThreadPool(min(8,len(gie)+1))
+        try:
+            stateMerge = pool.apply_async(mergeStateFiles)
+            pool.map(mergeGieFiles, gie)
+            stateMerge.get()
+        finally:
+            pool.close()
+            pool.join()
 
     def finalizePackage(self,result):
         '''
         '''
+        import shutil
+        from multiprocessing.pool import ThreadPool
 
-        shutil.move(result['directory']+slash+self.packageName+'.py', self.outputDir+slash+self.packageName+'.py')
+        shutil.move(os.path.join(result['directory'],self.packageName+'.py'), os.path.join(self.outputDir,self.packageName+'.py'))
 
-        with open(result['directory']+slash+'meshFiles.txt', "r") as meshFiles:
+        with open(os.path.join(result['directory'],'meshFiles.txt'), "r") as meshFiles:
             self.meshes = meshFiles.read().splitlines()
 
         self.checkExistance(self.meshDir)
 
         if self.meshes:
-            for mesh in self.meshes:
-                self.copy(mesh, self.meshDir)
+            # Copies are I/O bound, so they can overlap each other in threads
+            pool = ThreadPool(min(8,len(self.meshes)))
+            try:
+                pool.map(lambda mesh: self.copy(mesh, self.meshDir), self.meshes)
+            finally:
+                pool.close()
+                pool.join()
 
         if self.addToLibBool :
 
@@ -310,7 +639,10 @@ class PackageBuilder():
         '''
         '''
 
-        self.copy(self.outputDir, pathToReducedModel+self.packageName+slash)
+        import shutil
+
+        self.copy(self.outputDir, os.path.join(pathToReducedModel,self.packageName)+os.sep,
+                  ignore=shutil.ignore_patterns('.cache','file_manifest.json'))
 
         try:
             with open(path+'myInit.txt', "r") as myfile:
@@ -319,24 +651,25 @@ class PackageBuilder():
                 myInit = myInit.replace('MyReducedModel',self.packageName[0].upper()+self.packageName[1:])
                 myInit = myInit.replace('myReducedModel',self.packageName)
 
-                with open(pathToReducedModel+self.packageName+slash+'__init__.py', "a") as logFile:
+                with open(os.path.join(pathToReducedModel,self.packageName,'__init__.py'), "a") as logFile:
                     logFile.write(myInit)
 
                 # print(myInit)
 
-            for line in fileinput.input(pathToReducedModel+'__init__.py', inplace=True):
-                if line.find('__all__') != -1:
-                    if line.find('[]') != -1:
-                        line = line[:-2]+"'"+self.packageName+"']"'\n'
+            def addPackage(match):
+                items = match.group(2).strip()
+                if items:
+                    items += ','
+                return match.group(1)+items+"'"+self.packageName+"']"
 
-                    else:
-                        line = line[:-2]+",'"+self.packageName+"']"'\n'
-                    print("%s" % line),
+            with open(pathToReducedModel+'__init__.py', "r") as initFile:
+                init = initFile.read()
 
-                else : print(line),
+            with open(pathToReducedModel+'__init__.py', "w") as initFile:
+                initFile.write(_allPattern.sub(addPackage,init,count=1))
 
         except:
-            print "Unexpected error:", sys.exc_info()[0]
+            print("Unexpected error:", sys.exc_info()[0])
             raise
 
 class ReductionParam():
@@ -352,7 +685,7 @@ class ReductionParam():
 
         self.addRigidBodyModes = addRigidBodyModes
         self.dataDir = dataDir
-        self.dataFolder = slash+dataDir.split(slash)[-2]+slash
+        self.dataFolder = os.sep+os.path.basename(os.path.dirname(dataDir))+os.sep
 
         self.stateFileName = "stateFile.state"
         self.modesFileName = "modes.txt"
@@ -383,79 +716,56 @@ class ReductionParam():
 
         nodeToParse = '@.'+nodeToReduce
 
-        defaultParamPrepare = {
-                'paramForcefield' : {
-                    'prepareECSW' : True,
-                    'modesPath': self.dataDir+self.modesFileName,
-                    'periodSaveGIE' : self.periodSaveGIE,
-                    'nbTrainingSet' : self.nbTrainingSet},
-
-                'paramMORMapping' : {
-                    'input': '@../MechanicalObject',
-                    'modesPath': self.dataDir+self.modesFileName},
-
-                'paramMappedMatrixMapping' : {
-                    'nodeToParse': nodeToParse,
-                    'template': 'Vec1d,Vec1d',
-                    'object1': '@./MechanicalObject',
-                    'object2': '@./MechanicalObject',
-                    'timeInvariantMapping1': True,
-                    'timeInvariantMapping2': True,
-                    'performECSW': False}
-                }
-
-        defaultParamPerform = {
-                'paramForcefield' : {
-                    'performECSW': True,
-                    'modesPath': self.dataFolder+self.modesFileName,
-                    'RIDPath': self.dataFolder,
-                    'weightsPath': self.dataFolder},
-
-                'paramMORMapping' : {
-                    'input': '@../MechanicalObject',
-                    'modesPath': self.dataFolder+self.modesFileName},
-
-                'paramMappedMatrixMapping' : {
-                    'nodeToParse': nodeToParse,
-                    'template': 'Vec1d,Vec1d',
-                    'object1': '@./MechanicalObject',
-                    'object2': '@./MechanicalObject',
-                    'timeInvariantMapping1': True,
-                    'timeInvariantMapping2': True,
-                    'listActiveNodesPath' : self.dataFolder+'listActiveNodes.txt',
-                    'performECSW': True,
-                    'usePrecomputedMass': True,
-                    'precomputedMassPath': self.dataFolder+self.massName}
-                }
-
         if paramForcefield and paramMappedMatrixMapping and paramMORMapping :
             pass
         else:
             if prepareECSW:
                 self.paramWrapper = (   (nodeToReduce ,
-                                       {'paramForcefield': defaultParamPrepare['paramForcefield'].copy(),
-                                        'paramMORMapping': defaultParamPrepare['paramMORMapping'].copy(),
-                                        'paramMappedMatrixMapping': defaultParamPrepare['paramMappedMatrixMapping'].copy()} ) )
+                                        _fillParamTemplate(_paramPrepareTemplate,
+                                                           {'$modesPath': self.dataDir+self.modesFileName,
+                                                            '$periodSaveGIE': self.periodSaveGIE,
+                                                            '$nbTrainingSet': self.nbTrainingSet,
+                                                            '$nodeToParse': nodeToParse}) ) )
 
             else :
                 self.paramWrapper = (   (nodeToReduce ,
-                                       {'paramForcefield': defaultParamPerform['paramForcefield'].copy(),
-                                        'paramMORMapping': defaultParamPerform['paramMORMapping'].copy(),
-                                        'paramMappedMatrixMapping': defaultParamPerform['paramMappedMatrixMapping'].copy()} ) )
+                                        _fillParamTemplate(_paramPerformTemplate,
+                                                           {'$modesPath': self.dataFolder+self.modesFileName,
+                                                            '$dataFolder': self.dataFolder,
+                                                            '$nodeToParse': nodeToParse,
+                                                            '$listActiveNodesPath': self.dataFolder+'listActiveNodes.txt',
+                                                            '$precomputedMassPath': self.dataFolder+self.massName}) ) )
 
         return self.paramWrapper
 
+    def _resolveNbrOfModes(self,nbrOfModes,nbrOfModesPossible):
+        '''
+        Return the number of modes to keep (by default all of them)
+        after checking it against the *nbrOfModesPossible* of the modes file
+        '''
+
+        if not nbrOfModes:
+            nbrOfModes = self.nbrOfModes
+        if nbrOfModes == -1 :
+            nbrOfModes = self.nbrOfModes = nbrOfModesPossible
+
+        if (nbrOfModes <= 0) or (nbrOfModes > nbrOfModesPossible):
+            raise ValueError("nbrOfModes incorrect\n"\
+                +"  nbrOfModes given :"+str(nbrOfModes)+" | nbrOfModes max possible : "+str(nbrOfModesPossible))
+
+        return nbrOfModes
+
     def setFilesName(self):
         '''
         '''
 
         path , param = self.paramWrapper
-        nodeName = path.split(slash)[-1]
-        self.gieFilesNames.append('HyperReducedFEMForceField_'+nodeName+'_Gie.txt')
-        self.RIDFilesNames.append('RID_'+nodeName+'.txt')
-        self.weightsFilesNames.append('weight_'+nodeName+'.txt')
-        self.savedElementsFilesNames.append('elmts_'+nodeName+'.txt')
-        self.listActiveNodesFilesNames.append('listActiveNodes_'+nodeName+'.txt')
+        nodeName = path.split('/')[-1]
+        self.gieFilesNames.append('HyperReducedFEMForceField_%s_Gie.txt' % nodeName)
+        self.RIDFilesNames.append('RID_%s.txt' % nodeName)
+        self.weightsFilesNames.append('weight_%s.txt' % nodeName)
+        self.savedElementsFilesNames.append('elmts_%s.txt' % nodeName)
+        self.listActiveNodesFilesNames.append('listActiveNodes_%s.txt' % nodeName)
 
 class ReduceModel():
     """
@@ -489,6 +799,9 @@ class ReduceModel():
     | phaseToSave       | list(int)                       | List of 0/1 indicating during which phase to save the elements/X0                         |
     |                   |                                 | ``by default will save during first phase``                                               |
     +-------------------+---------------------------------+-------------------------------------------------------------------------------------------+
+    | useCache          | Bool                            | If ``True`` will reuse the results of each phase stored in outputDir/.cache when their    |
+    |                   |                                 | scenes & input files are unchanged since the previous run                                 |
+    +-------------------+---------------------------------+-------------------------------------------------------------------------------------------+
 
     """
     def __init__(self,
@@ -503,7 +816,8 @@ class ReduceModel():
                  verbose = False,
                  addRigidBodyModes = False,
                  nbrCPU = 4,
-                 phaseToSave = None):
+                 phaseToSave = None,
+                 useCache = False):
 
         self.originalScene = os.path.normpath(originalScene)
         self.nodeToReduce = nodeToReduce
@@ -531,6 +845,7 @@ class ReduceModel():
         self.phaseToSaveIndex = 0
         self.nbrCPU = nbrCPU
         self.verbose = verbose
+        self.useCache = useCache
 
         self.activesNodesLists = []
         self.listSofaScene = []
@@ -580,20 +895,82 @@ class ReduceModel():
         if not self.phaseToSave:
             self.phaseToSave = [0]*len(self.reductionAnimations.phaseNumClass[0])
 
+        # The phase matching phaseToSave doesn't depend on the loop, look for it only once
+        saveIndex = -1
+        if len(self.phaseToSave) == self.reductionAnimations.nbActuator:
+            match = np.flatnonzero((self.reductionAnimations.phaseNumClass == self.phaseToSave).all(axis=1))
+            if match.size:
+                saveIndex = int(match[0])
+
+        # Arguments shared by all the scenes, only their PHASE differs
+        sceneArgs = {   "ORIGINALSCENE": self.originalScene,
+                        "LISTOBJTOANIMATE": self.reductionAnimations.listObjToAnimate,
+                        "PERIODSAVEGIE" : self.reductionParam.periodSaveGIE,
+                        "PARAMWRAPPER" : self.reductionParam.paramWrapper,
+                        "nbIterations":self.reductionAnimations.nbIterations,
+                        "PHASETOSAVE" : self.phaseToSave}
+
         for i in phasesToExecute:
             if i >= self.reductionAnimations.nbPossibility or i < 0 :
                 raise ValueError("phasesToExecute incorrect, select an non-existent phase : "+phasesToExecute)
-            if self.phaseToSave == self.reductionAnimations.phaseNumClass[i]:
-                self.phaseToSaveIndex = self.reductionAnimations.phaseNumClass.index(self.phaseToSave)
+            if i == saveIndex:
+                self.phaseToSaveIndex = i
                 # print("INDEX -------------------> "+str(self.phaseToSaveIndex))
 
-            self.listSofaScene.append({ "ORIGINALSCENE": self.originalScene,
-                                        "LISTOBJTOANIMATE": self.reductionAnimations.listObjToAnimate,
-                                        "PHASE": self.reductionAnimations.phaseNumClass[i],
-                                        "PERIODSAVEGIE" : self.reductionParam.periodSaveGIE,
-                                        "PARAMWRAPPER" : self.reductionParam.paramWrapper,
-                                        "nbIterations":self.reductionAnimations.nbIterations,
-                                        "PHASETOSAVE" : self.phaseToSave})
+            self.listSofaScene.append(dict(sceneArgs, PHASE=self.reductionAnimations.phaseNumClass[i].tolist()))
+
+    def _startSofa(self,filesandtemplates,inputFiles):
+        '''
+        Execute self.listSofaScene with *filesandtemplates* in parallel and return their results.
+
+        If useCache is activated and the same scenes were already executed with the same templates
+        & *inputFiles* with the same content, the results of that previous execution are returned instead.
+        Their directories are then the ones stored in outputDir/.cache, they are only read by the phases.
+        The version of Sofa isn't part of the key, clear outputDir/.cache after updating it.
+        '''
+        if not self.useCache:
+            return startSofa(self.listSofaScene, filesandtemplates, launcher=ParallelLauncher(self.nbrCPU))
+
+        import hashlib
+        import pickle
+        import shutil
+
+        def toJson(obj):
+            if isinstance(obj, ObjToAnimate):
+                return dict((attr, getattr(obj, attr)) for attr in ObjToAnimate.__slots__)
+            if hasattr(obj, '__name__'):
+                return getattr(obj, '__module__', '')+'.'+obj.__name__
+            return repr(obj)
+
+        key = hashlib.sha256(json.dumps(self.listSofaScene, sort_keys=True, default=toJson).encode('utf-8'))
+        for template, fileName in filesandtemplates:
+            key.update((fileName+template).encode('utf-8'))
+        _hashFiles(key, inputFiles)
+        entryDir = os.path.join(self.packageBuilder.cacheDir, 'sofa', key.hexdigest())
+        resultFile = os.path.join(entryDir, 'results.pkl')
+
+        def moveResult(res, directory):
+            # Every path of the result is inside its directory
+            return dict((name, directory+value[len(res["directory"]):]
+                            if hasattr(value, 'startswith') and value.startswith(res["directory"]) else value)
+                        for name, value in res.items())
+
+        if os.path.isfile(resultFile):
+            with open(resultFile, 'rb') as f:
+                cachedResults = pickle.load(f)
+            return [moveResult(res, os.path.join(entryDir, str(i))) for i, res in enumerate(cachedResults)]
+
+        results = startSofa(self.listSofaScene, filesandtemplates, launcher=ParallelLauncher(self.nbrCPU))
+
+        # Remove what an interrupted previous run could have left
+        shutil.rmtree(entryDir, ignore_errors=True)
+        for i, res in enumerate(results):
+            shutil.copytree(res["directory"], os.path.join(entryDir, str(i)))
+        # written last, an entry is only valid once all its results are stored
+        with open(resultFile, 'wb') as f:
+            pickle.dump(results, f, 2)
+
+        return results
 
     def performReduction(self,phasesToExecute=None,nbrOfModes=None):
         """
@@ -612,6 +989,8 @@ class ReduceModel():
         If you are sure of all the parameters this way is recommended to gain time
 
         """
+        import datetime
+
         ### This initila time we allow us to give at the end the total time execution
         init_time = time.time()
 
@@ -652,11 +1031,9 @@ class ReduceModel():
         self.setListSofaScene(phasesToExecute)
 
         filenames = ["phase1_snapshots.py","debug_scene.py"]
-        filesandtemplates = []
-        for filename in filenames:                
-            filesandtemplates.append( (open(path+filename).read(), filename) )
+        filesandtemplates = [(_templates[filename], filename) for filename in filenames]
 
-        results = startSofa(self.listSofaScene, filesandtemplates, launcher=ParallelLauncher(self.nbrCPU))
+        results = self._startSofa(filesandtemplates, [self.originalScene])
 
         if self.verbose:
             for res in results:
@@ -666,7 +1043,7 @@ class ReduceModel():
                 print("     duration: "+str(res["duration"])+" sec")  
 
         self.packageBuilder.copyAndCleanState(results,self.reductionParam.periodSaveGIE,self.reductionParam.stateFileName)
-        self.packageBuilder.copy(results[self.phaseToSaveIndex]["directory"]+slash+"debug_scene.py", self.packageBuilder.debugDir)
+        self.packageBuilder.copy(os.path.join(results[self.phaseToSaveIndex]["directory"],"debug_scene.py"), self.packageBuilder.debugDir)
 
         print("PHASE 1 --- %s seconds ---" % (time.time() - start_time))
 
@@ -686,8 +1063,18 @@ class ReduceModel():
 
         self.packageBuilder.checkExistance(self.packageBuilder.dataDir)
  
-        self.reductionParam.nbrOfModes = readStateFilesAndComputeModes(stateFilePath = self.packageBuilder.debugDir+self.reductionParam.stateFileName,
-                                                        modesFileName = self.packageBuilder.dataDir+self.reductionParam.modesFileName,
+        stateFilePath = self.packageBuilder.debugDir+self.reductionParam.stateFileName
+        modesFileName = self.packageBuilder.dataDir+self.reductionParam.modesFileName
+
+        cacheDir = self.packageBuilder.cacheDir if self.useCache else None
+
+        self.reductionParam.nbrOfModes = _cachedCall(   cacheDir,
+                                                        [stateFilePath],
+                                                        [modesFileName, os.path.join(os.path.dirname(stateFilePath),'Sdata.txt')],
+                                                        (self.reductionParam.tolModes,self.reductionParam.addRigidBodyModes),
+                                                        readStateFilesAndComputeModes,
+                                                        stateFilePath = stateFilePath,
+                                                        modesFileName = modesFileName,
                                                         tol = self.reductionParam.tolModes,
                                                         addRigidBodyModes = self.reductionParam.addRigidBodyModes,
                                                         verbose= self.verbose)
@@ -730,23 +1117,13 @@ class ReduceModel():
 
         if not phasesToExecute:
             phasesToExecute = list(range(self.reductionAnimations.nbPossibility))
-        if not nbrOfModes:
-            nbrOfModes = self.reductionParam.nbrOfModes
 
         if not os.path.isfile(self.packageBuilder.dataDir+self.reductionParam.modesFileName):
             raise IOError("There is no mode file at "+self.packageBuilder.dataDir+self.reductionParam.modesFileName\
                 +"\nPlease give one at this location or indicate the correct location or re-generate one with phase 1 & 2")
 
-        nbrOfModesPossible = self.packageBuilder.checkNodeNbr(self.reductionParam.modesFileName)
-
-        if not nbrOfModes:
-            nbrOfModes = self.reductionParam.nbrOfModes
-        if nbrOfModes == -1 :
-            nbrOfModes = self.reductionParam.nbrOfModes = nbrOfModesPossible
-
-        if (nbrOfModes <= 0) or (nbrOfModes > nbrOfModesPossible):
-            raise ValueError("nbrOfModes incorrect\n"\
-                +"  nbrOfModes given :"+str(nbrOfModes)+" | nbrOfModes max possible : "+str(nbrOfModesPossible))
+        nbrOfModes = self.reductionParam._resolveNbrOfModes(nbrOfModes,
+                        self.packageBuilder.checkNodeNbr(self.reductionParam.modesFileName))
 
         self.setListSofaScene(phasesToExecute)
 
@@ -754,11 +1131,10 @@ class ReduceModel():
             self.listSofaScene[i]['NBROFMODES'] = nbrOfModes
 
         filenames = ["phase2_prepareECSW.py","phase1_snapshots.py","debug_scene.py"]
-        filesandtemplates = []
-        for filename in filenames:                
-            filesandtemplates.append( (open(path+filename).read(), filename) )
+        filesandtemplates = [(_templates[filename], filename) for filename in filenames]
              
-        results = startSofa(self.listSofaScene, filesandtemplates, launcher=ParallelLauncher(self.nbrCPU))
+        results = self._startSofa(filesandtemplates, [  self.originalScene,
+                                                        self.packageBuilder.dataDir+self.reductionParam.modesFileName])
 
         if self.verbose:
             for res in results:
@@ -767,29 +1143,22 @@ class ReduceModel():
                 print("        scene: "+res["scene"])
                 print("     duration: "+str(res["duration"])+" sec")
 
-        files = glob.glob(results[self.phaseToSaveIndex]["directory"]+slash+"*_elmts.txt")
-        if files:
-            for i,file in enumerate(files):
-                file = os.path.normpath(file)
-                files[i] = file.split(slash)[-1]
-            # print("FILES ----------->",files)
-            self.reductionParam.savedElementsFilesNames = files
+        saveDir = results[self.phaseToSaveIndex]["directory"]
+        elmtsFiles, gieFiles, massFiles = _listResultFiles(saveDir)
 
-        for fileName in self.reductionParam.savedElementsFilesNames :
-            self.packageBuilder.copyFileIntoAnother(results[self.phaseToSaveIndex]["directory"]+slash+fileName,self.packageBuilder.debugDir+fileName)
+        if elmtsFiles:
+            self.reductionParam.savedElementsFilesNames = elmtsFiles
 
-        self.reductionParam.massName = glob.glob(results[self.phaseToSaveIndex]["directory"]+slash+"*_reduced.txt")[0]
-        # print("massName -----------------------> ",self.reductionParam.massName)
-        self.packageBuilder.copy(self.reductionParam.massName,self.reductionParam.dataDir)
+        for fileName in self.reductionParam.savedElementsFilesNames :
+            self.packageBuilder.copyFileIntoAnother(os.path.join(saveDir,fileName),self.packageBuilder.debugDir+fileName)
 
+        if not massFiles:
+            raise IOError("Missing reduced mass File")
+        self.reductionParam.massName = massFiles[0]
+        self.packageBuilder.copy(os.path.join(saveDir,self.reductionParam.massName),self.reductionParam.dataDir)
 
-        files = glob.glob(results[self.phaseToSaveIndex]["directory"]+slash+"*_Gie.txt")
-        if files: 
-            for i,file in enumerate(files):
-                file = os.path.normpath(file)
-                files[i] = file.split(slash)[-1]
-            # print("FILES ----------->",files)
-            self.reductionParam.gieFilesNames = files
+        if gieFiles:
+            self.reductionParam.gieFilesNames = gieFiles
         else:
             raise IOError("Missing GIE Files")
 
@@ -797,6 +1166,13 @@ class ReduceModel():
                                                 'step2_'+self.reductionParam.stateFileName,
                                                 gie=self.reductionParam.gieFilesNames)
 
+        # Save which files were produced, with each elements file aligned on its GIE file, for phase4
+        self.reductionParam.savedElementsFilesNames = _matchElementsFiles(self.reductionParam.gieFilesNames,
+                                                                          self.reductionParam.savedElementsFilesNames)
+        with open(self.packageBuilder.debugDir+'file_manifest.json', "w") as manifestFile:
+            json.dump({ "gie": self.reductionParam.gieFilesNames,
+                        "elmts": self.reductionParam.savedElementsFilesNames,
+                        "mass": self.reductionParam.massName}, manifestFile)
 
         print("PHASE 3 --- %s seconds ---" % (time.time() - start_time))
 
@@ -819,8 +1195,8 @@ class ReduceModel():
             - add it to the plugin library if option activated
 
         """
-        # MOR IMPORT
-        from script import readGieFileAndComputeRIDandWeights, convertRIDinActiveNodes
+        import heapq
+        import multiprocessing
 
         start_time = time.time()
 
@@ -828,92 +1204,85 @@ class ReduceModel():
             raise IOError("There is no mode file at "+self.packageBuilder.dataDir+self.reductionParam.modesFileName\
                 +"\nPlease give one at this location or indicate the correct location or re-generate one with phase 1 & 2")
 
-        nbrOfModesPossible = self.packageBuilder.checkNodeNbr(self.reductionParam.modesFileName)
+        nbrOfModes = self.reductionParam._resolveNbrOfModes(nbrOfModes,
+                        self.packageBuilder.checkNodeNbr(self.reductionParam.modesFileName))
+
+        elmtsFiles, gieFiles, _ = _listResultFiles(self.packageBuilder.debugDir)
+        massFiles = _listResultFiles(self.packageBuilder.dataDir)[2]
+
+        manifest = None
+        if os.path.isfile(self.packageBuilder.debugDir+'file_manifest.json'):
+            # Files saved by phase3, already aligned
+            with open(self.packageBuilder.debugDir+'file_manifest.json', "r") as manifestFile:
+                manifest = json.load(manifestFile)
+            # Only trust it if the folders weren't modified since
+            if (set(manifest["gie"]) != set(gieFiles)
+                    or not set(manifest["elmts"]).issubset(elmtsFiles)
+                    or manifest["mass"] not in massFiles):
+                manifest = None
+
+        if manifest:
+            self.reductionParam.gieFilesNames = manifest["gie"]
+            self.reductionParam.savedElementsFilesNames = manifest["elmts"]
+            self.reductionParam.massName = manifest["mass"]
+        else:
+            if elmtsFiles:
+                self.reductionParam.savedElementsFilesNames = elmtsFiles
+            if gieFiles:
+                self.reductionParam.gieFilesNames = gieFiles
 
-        if not nbrOfModes:
-            nbrOfModes = self.reductionParam.nbrOfModes
-        if nbrOfModes == -1 :
-            nbrOfModes = self.reductionParam.nbrOfModes = nbrOfModesPossible
+            self.reductionParam.savedElementsFilesNames = _matchElementsFiles(self.reductionParam.gieFilesNames,
+                                                                              self.reductionParam.savedElementsFilesNames)
 
-        if (nbrOfModes <= 0) or (nbrOfModes > nbrOfModesPossible):
-            raise ValueError("nbrOfModes incorrect\n"\
-                +"  nbrOfModes given :"+str(nbrOfModes)+" | nbrOfModes max possible : "+str(nbrOfModesPossible))
+            self.reductionParam.massName = massFiles[0]
+            # print("massName -----------------------> ",self.reductionParam.massName)
 
-        # print(files)
-        files = glob.glob(self.packageBuilder.debugDir+"*_elmts.txt")
-        if files:
-            for i,file in enumerate(files):
-                file = os.path.normpath(file)
-                files[i] = file.split(slash)[-1]
-            # print("FILES ----------->",files)
-            self.reductionParam.savedElementsFilesNames = files
-
-        files = glob.glob(self.packageBuilder.debugDir+"*_Gie.txt")
-        if files: 
-            for i,file in enumerate(files):
-                file = os.path.normpath(file)
-                files[i] = file.split(slash)[-1]
-            # print("FILES ----------->",files)
-            self.reductionParam.gieFilesNames = files
-
-
-        for i , gie in enumerate(self.reductionParam.gieFilesNames):
-            tmp = gie.replace('_Gie.txt','')
-            for j , elmts in enumerate(self.reductionParam.savedElementsFilesNames):
-                if tmp in elmts:
-                    tmp = self.reductionParam.savedElementsFilesNames[j]
-                    self.reductionParam.savedElementsFilesNames[j] = self.reductionParam.savedElementsFilesNames[i]
-                    self.reductionParam.savedElementsFilesNames[i] = tmp
-
-        # print(self.reductionParam.savedElementsFilesNames)
-        # print(self.reductionParam.gieFilesNames)
-        tmp = glob.glob(self.packageBuilder.dataDir+"*_reduced.txt")[0]
-        tmp = os.path.normpath(tmp)
-        self.reductionParam.massName = tmp.split(slash)[-1]
-        # print("massName -----------------------> ",self.reductionParam.massName)
-
-
-        self.reductionParam.RIDFilesNames = []
-        self.reductionParam.weightsFilesNames = []
-        self.reductionParam.listActiveNodesFilesNames = []
+        # debugDir was already listed above, no need to stat each GIE file
+        debugGieFiles = set(gieFiles)
         for fileName in self.reductionParam.gieFilesNames :
-            if not os.path.isfile(self.packageBuilder.debugDir+fileName):
+            if fileName not in debugGieFiles:
                 raise IOError("There is no GIE file at "+self.packageBuilder.debugDir+fileName\
                     +"\nPlease give one at this location or indicate the correct location or re-generate one with phase 3")
 
-            self.reductionParam.RIDFilesNames.append(fileName.replace('_Gie','_RID'))
-            self.reductionParam.weightsFilesNames.append(fileName.replace('_Gie','_weight'))
-            self.reductionParam.listActiveNodesFilesNames.append(fileName.replace('_Gie','_listActiveNodes'))
+        gieFilesNames = self.reductionParam.gieFilesNames
+        self.reductionParam.RIDFilesNames = [fileName.replace('_Gie','_RID') for fileName in gieFilesNames]
+        self.reductionParam.weightsFilesNames = [fileName.replace('_Gie','_weight') for fileName in gieFilesNames]
+        self.reductionParam.listActiveNodesFilesNames = [fileName.replace('_Gie','_listActiveNodes') for fileName in gieFilesNames]
 
 
         self.listActiveNodesFilesNames = []
-        for i , fileName in enumerate(self.reductionParam.gieFilesNames) :
-
-            # index = self.reductionParam.gieFilesNames.index(fileName)
-            readGieFileAndComputeRIDandWeights( self.packageBuilder.debugDir+fileName,
-                                                self.packageBuilder.dataDir+self.reductionParam.RIDFilesNames[i],
-                                                self.packageBuilder.dataDir+self.reductionParam.weightsFilesNames[i],
-                                                self.reductionParam.tolGIE,
-                                                verbose= self.verbose)
-            # print(index)
-            # print(len(self.reductionParam.savedElementsFilesNames))
-            # if index-1 < len(self.reductionParam.savedElementsFilesNames):
-            self.activesNodesLists.append(  convertRIDinActiveNodes(self.packageBuilder.dataDir+self.reductionParam.RIDFilesNames[i],
-                                                                    self.packageBuilder.debugDir+self.reductionParam.savedElementsFilesNames[i],
-                                                                    self.packageBuilder.dataDir+self.reductionParam.listActiveNodesFilesNames[i],
-                                                                    verbose= self.verbose))
-
-        finalListActiveNodes = []
-        for activeNodes in self.activesNodesLists:
-                finalListActiveNodes = list(set().union(finalListActiveNodes,activeNodes))
-        finalListActiveNodes = sorted(finalListActiveNodes)
+
+        cacheDir = self.packageBuilder.cacheDir if self.useCache else None
+
+        # Each GIE file is independent from the others, they are processed in parallel
+        # when the workers can be forked (see _canFork)
+        tasks = [(  self.packageBuilder.debugDir+fileName,
+                    self.packageBuilder.dataDir+self.reductionParam.RIDFilesNames[i],
+                    self.packageBuilder.dataDir+self.reductionParam.weightsFilesNames[i],
+                    self.packageBuilder.debugDir+self.reductionParam.savedElementsFilesNames[i],
+                    self.packageBuilder.dataDir+self.reductionParam.listActiveNodesFilesNames[i],
+                    self.reductionParam.tolGIE,
+                    self.verbose,
+                    cacheDir) for i , fileName in enumerate(self.reductionParam.gieFilesNames)]
+
+        if self.nbrCPU > 1 and len(tasks) > 1 and _canFork():
+            pool = multiprocessing.Pool(min(self.nbrCPU,len(tasks)))
+            try:
+                self.activesNodesLists.extend(pool.map(_computeRIDandActiveNodes, tasks, chunksize=1))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            self.activesNodesLists.extend([_computeRIDandActiveNodes(task) for task in tasks])
+
+        # Each list of active nodes is already sorted by convertRIDinActiveNodes,
+        # merge them and drop the nodes shared by several forcefields
+        finalListActiveNodes = [node for node, _ in itertools.groupby(heapq.merge(*self.activesNodesLists))]
         with open(self.packageBuilder.dataDir+'listActiveNodes.txt', "w") as file:
-            for item in finalListActiveNodes:
-              file.write("%i\n" % item)
-        file.close()
+            file.write("".join(["%i\n" % item for item in finalListActiveNodes]))
 
         filename = "phase3_performECSW.py"
-        filesandtemplates = [(open(path+filename).read(), filename)]
+        filesandtemplates = [(_templates[filename], filename)]
 
         self.reductionParam.addParamWrapper(self.nodeToReduce, prepareECSW = False)
 
@@ -4,14 +4,9 @@
 import os
 import math
 import numpy as np
-import platform
 
 from sys import argv
 
-slash = '/'
-if "Windows" in platform.platform():
-    slash = "\\"
-
 def readStateFilesAndComputeModes(stateFilePath, tol, modesFileName , addRigidBodyModes=None, verbose=False ):
 
     print "###################################################"
@@ -90,8 +85,7 @@ def readStateFilesAndComputeModes(stateFilePath, tol, modesFileName , addRigidBo
         sSquare = [i**2 for i in s]
         sumSVD = np.sum(sSquare)
 
-        stateFilePath = os.path.normpath(stateFilePath)
-        outputDir = slash.join(stateFilePath.split(slash)[:-1])+slash
+        outputDir = os.path.join(os.path.dirname(stateFilePath),'')
         np.savetxt(outputDir+"Sdata.txt",s)
 
         i = 0
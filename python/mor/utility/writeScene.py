@@ -233,8 +233,7 @@ def writeGraphScene(packageName,nodeName,myMORModel,myModel):
                             if arg['filename'] not in filesName:
                                 filesName.append(arg['filename'])
 
-                            filename = os.path.normpath(arg['filename'])
-                            filename = filename.split(slash)[-1]
+                            filename = os.path.basename(os.path.normpath(arg['filename']))
 
                             arg['filename'] = slash+'mesh'+slash+filename
 